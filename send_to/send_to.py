@@ -62,10 +62,12 @@ Instantiate an object from the :code:`Cfg` class and set it data members.
 .. autoattribute:: Cfg.overwrite_file
 .. autoattribute:: Cfg.dry_run
 .. autoattribute:: Cfg.debug
+.. autoattribute:: Cfg.verbose
 .. autoattribute:: Cfg.subdir
 .. autoattribute:: Cfg.skip
 .. autoattribute:: Cfg.rename
 .. autoattribute:: Cfg.post_process
+.. autoattribute:: Cfg.async_post_process
 
 
 Creating the callback functions
@@ -73,7 +75,8 @@ Creating the callback functions
 There are 4 (optional) user defined functions that'll be called by
 :code:`send_to(cfg)`. They can be created in the script file and their names
 are set in the :code:`Cfg` object. These functions usually take an :code:`Info`
-object as an argument.
+object as an argument. A function that isn't needed can be left unset (it
+defaults to :code:`None`).
 
 
 The :code:`Info` class
@@ -81,9 +84,13 @@ The :code:`Info` class
 Information such as: source file path, destination path, date and description
 is stored in an `Info` object. This object is then passed to some of the user
 defined functions so this information can be used in e.g. naming the
-subdirectory, the file etc.
+subdirectory, the file etc. Prefer :code:`Info.file_name` and
+:code:`Info.file_ext` over splitting :code:`Info.file_path` in the user defined
+functions.
 
 .. autoattribute:: Info.file_path
+.. autoattribute:: Info.file_name
+.. autoattribute:: Info.file_ext
 .. autoattribute:: Info.dst_path
 .. autoattribute:: Info.date
 .. autoattribute:: Info.desc
@@ -136,10 +143,7 @@ Skip function
 
     def skip_jpgs(info: Info) -> str:
         \"""Tell `send_to(cfg)` to skip JPGs.\"""
-        file = os.path.basename(info.file_path)
-        file_name, file_ext = os.path.splitext(file)
-
-        if file_ext.lower() == '.jpg':
+        if info.file_ext.lower() == '.jpg':
             return True
         else:
             return False
@@ -168,10 +172,7 @@ Rename function
     def append_desc(info: Info) -> str:
         \"""Tell `send_to(cfg)` to append description to the destination file
         name.\"""
-        file = os.path.basename(info.file_path)
-        file_name, file_ext = os.path.splitext(file)
-
-        return (f"{file_name} {info.desc}{file_ext}")
+        return (f"{info.file_name} {info.desc}{info.file_ext}")
 
     cfg.rename = append_desc
 
@@ -207,6 +208,16 @@ Call :code:`send_to(cfg)`, passing it the configuration object :code:`Cfg`.
 
     send_to(cfg)
 
+The date and the description can also be passed to the script as
+:code:`--date=...` (a date or a day shift) and :code:`--desc=...` arguments,
+e.g. from a shortcut or another script. The user isn't prompted for the values
+that were passed.
+
+With :code:`Cfg.debug` set, :code:`send_to(cfg)` waits for "Enter" before
+returning so the console window stays open. It doesn't wait when the output
+isn't a console or when the :code:`SEND_TO_NOPAUSE` environment variable is
+set (to anything but an empty string).
+
 """
 
 __name__ = "send_to"
@@ -218,10 +229,25 @@ __license__ = "MIT"
 import sys
 import os
 from dataclasses import dataclass
-from enum import Enum
-from typing import Callable
+from enum import IntEnum
+from typing import BinaryIO, Callable, Optional
 from datetime import datetime, timedelta
 import shutil
+import errno
+import ctypes
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from contextlib import ExitStack
+from functools import lru_cache, partial
+
+
+# Buffer size of the copies done through user space. 1 MiB is a lot faster
+# than the 64 KiB `shutil` uses on POSIX, so `shutil` is raised to it as well
+# (but never lowered).
+_COPY_BUFSIZE = 1 << 20
+shutil.COPY_BUFSIZE = max(getattr(shutil, 'COPY_BUFSIZE', 0), _COPY_BUFSIZE)
+
+# `__version__` parsed once into (major, minor, patch)
+_VERSION_TUPLE = tuple(int(p) for p in __version__.split('.'))
 
 
 @dataclass
@@ -238,8 +264,19 @@ class Info:
     desc: str = ""
     """Description"""
 
+    file_name: str = ""
+    """The name of the currently processed file, without its extension."""
+
+    file_ext: str = ""
+    """The extension of the currently processed file (e.g. ".jpg")."""
 
-VersionPart = Enum("VersionPart", ['MAJOR', 'MINOR', 'PATCH'])
+
+class VersionPart(IntEnum):
+    """Part of a semver string."""
+
+    MAJOR = 1
+    MINOR = 2
+    PATCH = 3
 
 
 def semver_str_to_int(version: str, part: VersionPart) -> int:
@@ -252,30 +289,33 @@ def semver_str_to_int(version: str, part: VersionPart) -> int:
     Returns:
         int: part of the semver in int
     """
-    if part == VersionPart.MAJOR:
-        ver = version.split('.')[0]
-    elif part == VersionPart.MINOR:
-        ver = version.split('.')[1]
-    elif part == VersionPart.PATCH:
-        ver = version.split('.')[2]
-    else:
-        ver = -1
+    if not isinstance(part, VersionPart):
+        return -1
+
+    parts = version.split('.', 2)
+    return int(parts[part.value - 1])
 
-    return int(ver)
 
+class Operation(IntEnum):
+    """Operation that will be performed on the files."""
 
-Operation = Enum("Operation", ['MOVE', 'COPY'])
+    MOVE = 1
+    """Move the files to the destination."""
 
+    COPY = 2
+    """Copy the files to the destination."""
 
+
+@dataclass(slots=True)
 class Cfg:
     """Configuration used be :code:`send_to(cfg)` function."""
 
-    version: int = semver_str_to_int(__version__, VersionPart.MAJOR)
+    version: int = _VERSION_TUPLE[0]
     """Set it to the major version of the :code:`send_to` module that the
     script is currently developed for."""
 
-    dst_path: str
-    """Destination path for the processed files."""
+    dst_path: str = ""
+    """Destination path for the processed files. It has to be set."""
 
     operation: Operation = Operation.MOVE
     """Operation the will be performed on the files - copy or move."""
@@ -298,21 +338,29 @@ class Cfg:
     debug: bool = True
     """Print more console messages."""
 
-    subdir: Callable[[Info], str]
+    subdir: Optional[Callable[[Info], str]] = None
     """User defined function for determining the name of the subdirectory under
     :code:`dst_path` where the files will be placed."""
 
-    skip: Callable[[Info], bool]
+    skip: Optional[Callable[[Info], bool]] = None
     """User defined function for determining if a file will be skipped."""
 
-    rename: Callable[[Info], str]
+    rename: Optional[Callable[[Info], str]] = None
     """ User defined function for determining how the destination file will be
     named."""
 
-    post_process: Callable[[str], None]
+    post_process: Optional[Callable[[str], None]] = None
     """User defined function for doing post-processing on a destination
     file."""
 
+    async_post_process: bool = False
+    """Run :code:`post_process` in background threads, letting the next files
+    be transferred meanwhile. The files may then be post-processed
+    concurrently and out of order."""
+
+    verbose: bool = True
+    """Print a console message for every processed file."""
+
 
 class IncompatibleCfgVersion(Exception):
     """Script's major version and configuration's version don't match.
@@ -326,6 +374,27 @@ class InvalidDateInput(Exception):
     pass
 
 
+class InvalidCfgCallback(Exception):
+    """A user defined function in the configuration is set to something that
+    can't be called.
+    """
+    pass
+
+
+class MissingCfgDstPath(Exception):
+    """The destination path isn't set in the configuration.
+    """
+    pass
+
+
+# continuous and past tense of each operation, used in the console messages
+_OPERATION_WORDS = {
+    Operation.MOVE: ("moving", "moved"),
+    Operation.COPY: ("copying", "copied"),
+}
+_INVALID_OPERATION_WORDS = ("<invalid operation>",) * 2
+
+
 def operation_to_str(operation: Operation) -> tuple[str, str]:
     """Determine the words that will be used when printing to the console
     based on the configured operation.
@@ -336,53 +405,285 @@ def operation_to_str(operation: Operation) -> tuple[str, str]:
     Returns:
         tuple[str, str]: strings of the operation in continuous and past tense
     """
-    if operation is Operation.MOVE:
-        return ("moving", "moved")
-    elif operation is Operation.COPY:
-        return ("copying", "copied")
-    else:
-        return ("<invalid operation>", "<invalid operation>")
+    return _OPERATION_WORDS.get(operation, _INVALID_OPERATION_WORDS)
 
 
-def determine_date(ask_for_date: bool, date_fmt: str) -> str:
+@lru_cache(maxsize=8)
+def _is_valid_date(date: str, date_fmt: str) -> bool:
+    """Check if a date string complies with a date format. The result only
+    depends on the arguments, so it's cached.
+
+    Args:
+        date (str): the date string
+        date_fmt (str): string format of the date
+
+    Returns:
+        bool: True if the date complies with the format, False otherwise
+    """
+    try:
+        datetime.strptime(date, date_fmt)
+    except ValueError:
+        return False
+    return True
+
+
+def determine_date(ask_for_date: bool, date_fmt: str,
+                   date: Optional[str] = None) -> str:
     """Prompt the user for a date/use today's date and format it.
 
     Args:
         ask_for_date (bool): True - prompt the user to manually input the
             desired date, False - use today's date
         date_fmt (str): string format of the date
+        date (Optional[str]): date or day shift passed on the command line,
+            when set the user isn't prompted
 
     Returns:
         str: the determined date
     """
 
-    if ask_for_date:
-        date = input(
-            f"Input date (\'{date_fmt}\') or day shift (e.g. \'-1\' for "
-            "yesterday) or leave blank for today: "
-            )
-        try:
-            # this will succeed when the user inputs a date complying with the
-            # passed date format
-            datetime.strptime(date, date_fmt)
-        except ValueError:
-            # user wants to either use today's date or a date shift
-            if not date:  # nothing entered - use today's date
-                date = datetime.today().strftime(date_fmt)
-                print(f'using today\'s date: {date}')
-            elif int(date) < 0 and int(date) > -8:  # compute date shift
-                td = abs(int(date))
-                date = (datetime.now() - timedelta(td)).strftime(date_fmt)
-                print(f'shifting time by -{td} days: {date}')
-            else:
+    now = datetime.now()
+
+    if ask_for_date or date is not None:
+        if date is None:
+            date = input(
+                f"Input date (\'{date_fmt}\') or day shift (e.g. \'-1\' "
+                "for yesterday) or leave blank for today: "
+                )
+        # Look at the shape of the input first, instead of trying to parse it
+        # as a date and then as a number. Surrounding whitespace is ignored,
+        # like `int()` does.
+        date = date.strip()
+        if not date:  # nothing entered - use today's date
+            date = now.strftime(date_fmt)
+            print(f'using today\'s date: {date}')
+        elif date[0] == '-' and date[1:].isdecimal():  # compute date shift
+            td = int(date[1:])
+            if not 0 < td < 8:
+                raise InvalidDateInput
+            date = (now - timedelta(td)).strftime(date_fmt)
+            print(f'shifting time by -{td} days: {date}')
+        else:
+            # the user should have input a date complying with the passed date
+            # format
+            if not _is_valid_date(date, date_fmt):
                 raise InvalidDateInput
     else:
-        date = datetime.today().strftime(date_fmt)
+        date = now.strftime(date_fmt)
         print(f'using today\'s date: {date}')
 
     return date
 
 
+def split_args(args: list[str]) -> tuple[list[str], Optional[str],
+                                         Optional[str]]:
+    """Separate the :code:`--date=` and :code:`--desc=` options from the
+    files passed as arguments.
+
+    Args:
+        args (list[str]): the script's arguments
+
+    Returns:
+        tuple[list[str], Optional[str], Optional[str]]: the files, the date
+            and the description (None when not passed)
+    """
+    files = []
+    date = None
+    desc = None
+    for arg in args:
+        if arg.startswith('--date='):
+            date = arg[len('--date='):]
+        elif arg.startswith('--desc='):
+            desc = arg[len('--desc='):]
+        else:
+            files.append(arg)
+
+    return files, date, desc
+
+
+# errors on which `_move_file()` can't just rename and has to copy instead
+_RENAME_UNSUPPORTED = (errno.EXDEV, errno.ENOTSUP)
+
+
+def _move_file(src: str, dst: str, overwrite: bool) -> None:
+    """Move a file by renaming it, copying it only when it has to.
+
+    On the same filesystem a move is just a rename. :code:`shutil.move()` is
+    only used when the file can't be renamed to its destination (e.g. the
+    destination is on another drive).
+
+    Args:
+        src (str): path of the file that will be moved
+        dst (str): destination path of the file
+        overwrite (bool): the destination file may be overwritten
+    """
+    try:
+        if overwrite:
+            os.replace(src, dst)
+        else:
+            # fails on Windows if `dst` has appeared in the meantime
+            os.rename(src, dst)
+    except OSError as e:
+        if e.errno not in _RENAME_UNSUPPORTED:
+            raise
+        shutil.move(src, dst)
+
+
+# `CopyFile2()` is looked up once at import. It's only available on Windows 8
+# and newer.
+try:
+    _CopyFile2 = ctypes.WinDLL("kernel32").CopyFile2
+    _CopyFile2.argtypes = [ctypes.c_wchar_p, ctypes.c_wchar_p, ctypes.c_void_p]
+    _CopyFile2.restype = ctypes.c_long  # HRESULT
+except (OSError, AttributeError):
+    _CopyFile2 = None
+
+# facility of the HRESULTs that carry a Win32 error code
+_FACILITY_WIN32 = 7
+
+
+def _copy_file_range(src_fd: int, dst_fd: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count)
+
+
+def _sendfile(src_fd: int, dst_fd: int, count: int) -> int:
+    return os.sendfile(dst_fd, src_fd, None, count)
+
+
+# The in-kernel copies `_copy_file()` tries on Linux, fastest first.
+_KERNEL_COPIES = tuple(
+    copy for copy, name in ((_copy_file_range, 'copy_file_range'),
+                            (_sendfile, 'sendfile'))
+    if hasattr(os, name))
+
+# errors on which `_copy_file()` gives up on an in-kernel copy, e.g. copying
+# between filesystems on older kernels
+_KERNEL_COPY_UNSUPPORTED = (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                            errno.EOPNOTSUPP)
+
+
+def _copy_fileobj(fsrc: BinaryIO, fdst: BinaryIO) -> None:
+    """Copy the rest of :code:`fsrc` to :code:`fdst`, reading into one buffer
+    that is reused for the whole file.
+
+    Args:
+        fsrc (BinaryIO): file that is read
+        fdst (BinaryIO): file that is written
+    """
+    buf = bytearray(_COPY_BUFSIZE)
+    view = memoryview(buf)
+    while True:
+        read = fsrc.readinto(buf)
+        if not read:
+            break
+        fdst.write(view[:read])
+
+
+def _copy_file(src: str, dst: str) -> None:
+    """Copy a file with its permission bits, like :code:`shutil.copy()`, using
+    the fastest copy the platform offers.
+
+    On Windows :code:`CopyFile2()` is used (it also keeps the timestamps). On
+    Linux the kernel copies the data with :code:`os.copy_file_range()` (which
+    can also reflink it/copy it server-side) or :code:`os.sendfile()`, without
+    passing it through user space. Elsewhere (e.g. macOS, where it already
+    uses :code:`fcopyfile()`) :code:`shutil.copy()` is used.
+
+    Args:
+        src (str): path of the file that will be copied
+        dst (str): path of the copy
+
+    Raises:
+        shutil.SameFileError: Raised when :code:`src` and :code:`dst` are the
+            same file.
+    """
+    if _CopyFile2 is not None:
+        # `CopyFile2()` fails with a sharing violation instead
+        try:
+            same_file = os.path.samefile(src, dst)
+        except OSError:
+            same_file = False
+        if same_file:
+            raise shutil.SameFileError(
+                f'{src!r} and {dst!r} are the same file')
+
+        hr = _CopyFile2(src, dst, None)
+        if hr < 0:
+            # HRESULT_FROM_WIN32() keeps the Win32 error in the low word,
+            # other HRESULTs are reported as they are
+            if (hr >> 16) & 0x1FFF == _FACILITY_WIN32:
+                hr &= 0xFFFF
+            err = ctypes.WinError(hr)
+            err.filename, err.filename2 = src, dst
+            raise err
+        return
+
+    if not sys.platform.startswith('linux'):
+        shutil.copy(src, dst)
+        return
+
+    with open(src, 'rb') as fsrc:
+        # don't truncate `dst` before making sure it isn't `src`
+        dst_fd = os.open(dst, os.O_WRONLY | os.O_CREAT, 0o666)
+        with open(dst_fd, 'wb') as fdst:
+            src_fd = fsrc.fileno()
+            src_st = os.fstat(src_fd)
+            dst_st = os.fstat(dst_fd)
+            if os.path.samestat(src_st, dst_st):
+                raise shutil.SameFileError(
+                    f'{src!r} and {dst!r} are the same file')
+            os.ftruncate(dst_fd, 0)
+
+            # files in e.g. /proc report a size of 0, copy them in chunks
+            count = max(src_st.st_size, 1 << 23)
+            copied = 0
+            for kernel_copy in _KERNEL_COPIES:
+                try:
+                    while True:
+                        sent = kernel_copy(src_fd, dst_fd, count)
+                        if sent == 0:
+                            break
+                        copied += sent
+                except OSError as e:
+                    if copied or e.errno not in _KERNEL_COPY_UNSUPPORTED:
+                        raise
+                else:
+                    # Some kernels/filesystems (e.g. procfs, FUSE, NFS)
+                    # return 0 without copying anything, so 0 from the first
+                    # call isn't trusted as the end of the file. An empty
+                    # file just takes one more read to find that out.
+                    if copied:
+                        break
+            else:
+                # no in-kernel copy works here, copy through user space
+                _copy_fileobj(fsrc, fdst)
+
+    shutil.copymode(src, dst)
+
+
+def _post_process_when_done(transfer: Optional[Future],
+                            post_process: Callable[[str], None],
+                            file_path: str) -> None:
+    """Wait for a file's transfer to finish, then post-process the file if it
+    was transferred successfully.
+
+    Args:
+        transfer (Optional[Future]): the pending transfer of the file, None
+            when it isn't transferred in the background
+        post_process (Callable[[str], None]): the user's post-processing
+            function
+        file_path (str): path of the destination file
+    """
+    if transfer is not None and transfer.exception() is not None:
+        return  # the failed transfer is reported by `send_to()`
+    post_process(file_path)
+
+
+# Transfer the files in a thread pool when at least this many are passed.
+_PARALLEL_MIN_FILES = 2
+_PARALLEL_MAX_WORKERS = 32
+
+
 def print_help():
     """Print help. Used when calling this module directly."""
 
@@ -400,31 +701,45 @@ def send_to(cfg: Cfg) -> None:
     Raises:
         IncompatibleCfgVersion: Raised when the major version of the script
             doesn't match the version of the configuration object.
+        InvalidCfgCallback: Raised when a user defined function in the
+            configuration object is neither a function nor None.
+        MissingCfgDstPath: Raised when the destination path isn't set in the
+            configuration object.
     """
 
     print(f'send_to v{__version__}, cfg v{cfg.version}\n')
 
     # compare the major version of the script with the version configuration
     # object
-    script_maj_ver = semver_str_to_int(__version__, VersionPart.MAJOR)
-    if script_maj_ver != cfg.version:
+    if _VERSION_TUPLE[0] != cfg.version:
         raise IncompatibleCfgVersion
 
-    # determine the words that will be printed in the console based on the
-    # configured operation
-    op_str_cont, op_str_past = operation_to_str(cfg.operation)
+    # Check the user defined functions once, up front - everything after this
+    # only has to test them against None.
+    for name in ('subdir', 'skip', 'rename', 'post_process'):
+        fn = getattr(cfg, name)
+        if fn is not None and not callable(fn):
+            raise InvalidCfgCallback(f'Cfg.{name} is not callable')
+
+    # an empty path would put the files in the current working directory
+    if not cfg.dst_path:
+        raise MissingCfgDstPath
 
     # when using Window's shell:sendto the selected files are passed as
     # arguments after the script's name
-    files = sys.argv[1:]  # set files that will be copied/moved
-    if len(files) == 0:
+    files, date_arg, desc_arg = split_args(sys.argv[1:])
+    if not files:
+        # nothing to do - stop before prompting the user or creating anything
         sys.exit("Error: No files passed as arguments.")
 
-    # print a list of the files that will be processed
-    print(f'Files to be {op_str_past}: ', end='')
-    for file in files:
-        print(f'{os.path.basename(file)} ', end='')
-    print()
+    # determine the words that will be printed in the console based on the
+    # configured operation
+    op_str_cont, op_str_past = operation_to_str(cfg.operation)
+
+    # print a list of the files that will be processed (their names are
+    # reused when processing the files)
+    basenames = [os.path.basename(file) for file in files]
+    print(f'Files to be {op_str_past}: ' + ' '.join(basenames))
 
     # This object stores the information collected by the user and the current
     # file that is being processed. It'll be passed to the user defined
@@ -435,98 +750,213 @@ def send_to(cfg: Cfg) -> None:
     # Determine the date that will be used based on the passed configuration.
     # The date is collected and later passed to the `subdir()` and `rename()`
     # functions so it can be used in the sub-directory and/or the files names.
-    info.date = determine_date(cfg.ask_for_date, cfg.date_fmt)
+    info.date = determine_date(cfg.ask_for_date, cfg.date_fmt, date_arg)
 
     # Optionally ask the user for a description of the files that will be
     # processed.
     # The description is also collected for the same purpose as the date.
-    if cfg.ask_for_desc:
+    if desc_arg is not None:
+        info.desc = desc_arg
+    elif cfg.ask_for_desc:
         info.desc = input('Input description (can be left blank): ')
     else:
         info.desc = ""
 
     subdir_name = ""
-    try:
+    if cfg.subdir is not None:
         # Call the user's function `subdir(info)` to determine the name of the
         # subdirectory where the file be placed. When an empty string is
         # returned - no subdirectory is created.
         subdir_name = cfg.subdir(info)
-    except AttributeError:  # no subdir function assigned
-        pass
 
     if subdir_name != "":
         # If a sub-directory name was returned - try to create it.
-        info.dst_path = f"{cfg.dst_path}\\{subdir_name}"
+        info.dst_path = os.path.join(cfg.dst_path, subdir_name)
 
         if cfg.dry_run is False:
-            try:
-                os.mkdir(info.dst_path)
+            if cfg.debug and os.path.isdir(info.dst_path):
+                print('DEBUG: directory already exists')
+            else:
+                os.makedirs(info.dst_path, exist_ok=True)
                 if cfg.debug:
                     print(f'DEBUG: created directory {info.dst_path}')
-            except FileExistsError:
-                if cfg.debug:
-                    print('DEBUG: directory already exists')
     else:
         info.dst_path = cfg.dst_path
 
-    for file in files:
-        skip = False
-        try:
-            # Call the user's function `skip(info)` to determine if the current
-            # file should be skipped.
+    # Bind everything the loop needs to locals once - the configuration
+    # doesn't change while the files are being processed.
+    skip_fn = cfg.skip
+    rename_fn = cfg.rename
+    post_process_fn = cfg.post_process
+    is_move = cfg.operation is Operation.MOVE
+    is_copy = cfg.operation is Operation.COPY
+    overwrite_file = cfg.overwrite_file
+    dry_run = cfg.dry_run
+    verbose = cfg.verbose
+    # `print()` rather than `sys.stdout.write()`: `sys.stdout` is None under
+    # pythonw
+    write = partial(print, end='')
+    # every destination file is placed directly under this prefix (joining
+    # doesn't double the separator when e.g. `dst_path` is a drive's root)
+    dst_prefix = os.path.join(info.dst_path, '')
+
+    # Pick how the files are transferred once instead of checking the
+    # operation for every file. Nothing is transferred in a dry run.
+    transfer_file = None
+    if dry_run is False:
+        if is_move:
+            transfer_file = partial(_move_file, overwrite=overwrite_file)
+        elif is_copy:
+            transfer_file = _copy_file
+
+    # When more than one file is passed the transfers are done in a thread
+    # pool - the GIL is released while the files are copied/renamed. The user
+    # defined functions and the console messages stay in this thread and in
+    # order, post-processing of a file is deferred until its transfer is done.
+    # A failed transfer doesn't stop the other files, the failures are
+    # reported once all files are processed.
+    use_transfer_pool = (transfer_file is not None
+                         and len(files) >= _PARALLEL_MIN_FILES)
+    pending_transfers: dict[str, Future] = {}  # destination path -> transfer
+    transfers: list[tuple[str, Future]] = []
+    deferred_post_process: list[str] = []
+
+    def submit_transfer(src: str, dst: str) -> None:
+        if dst in pending_transfers:
+            # don't let two transfers write the same file at once
+            wait([pending_transfers[dst]])
+        pending = transfer_pool.submit(transfer_file, src, dst)
+        pending_transfers[dst] = pending
+        transfers.append((dst, pending))
+
+    transfer = transfer_file
+    if use_transfer_pool:
+        transfer = submit_transfer
+
+    # Optionally post-process in the background instead of waiting for each
+    # file's post-processing before moving on to the next file.
+    use_post_process_pool = (post_process_fn is not None
+                             and cfg.async_post_process)
+    post_processes: list[tuple[str, Future]] = []
+
+    # List the destination once instead of checking if each file exists. The
+    # names are compared the way the OS compares them (e.g. ignoring case on
+    # Windows).
+    try:
+        with os.scandir(info.dst_path) as entries:
+            existing_names = {os.path.normcase(e.name) for e in entries}
+    except FileNotFoundError:  # e.g. a subdirectory not created in a dry run
+        existing_names = set()
+
+    # The pools are shut down (waiting for their work) when leaving the
+    # `with` block, also when a user defined function raises.
+    with ExitStack() as pools:
+        transfer_pool = None
+        if use_transfer_pool:
+            transfer_pool = pools.enter_context(ThreadPoolExecutor(
+                max_workers=min(_PARALLEL_MAX_WORKERS, len(files))))
+        post_process_pool = None
+        if use_post_process_pool:
+            post_process_pool = pools.enter_context(
+                ThreadPoolExecutor(max_workers=os.cpu_count()))
+
+        for file, basename in zip(files, basenames):
             info.file_path = file
-            skip = cfg.skip(info)
-        except TypeError:  # no skip function assigned
-            pass
-
-        if skip:
-            print(f'{file} is ignored')
-            continue  # go to next file
-
-        new_file_name = ""  # the name of the file + its extension
-        try:
-            # Call the user's function `rename(info)` to determine the new name
-            # of the currenly processed file. When an empty string is returned
-            # - the original file's name will be used.
-            new_file_name = cfg.rename(info)
-        except TypeError:  # no renaming function assigned
-            pass
-
-        if new_file_name == "":
-            # if no name was returned - use the original name
-            new_file_name = os.path.basename(file)
-
-        # prepend the directory's path to the full file name
-        new_file = info.dst_path + '\\' + new_file_name
-
-        print(f'{op_str_cont} {file} to {new_file}', end='')
-
-        file_exists = os.path.exists(new_file)
-        if file_exists and cfg.overwrite_file is False:
-            print(' - already exists, skipping')
-        else:
-            if file_exists:
-                print(' - already exists, overwritting', end='')
-
-            if cfg.dry_run is False:
-                if cfg.operation == Operation.MOVE:
-                    shutil.move(file, new_file)
-                elif cfg.operation == Operation.COPY:
-                    shutil.copy(file, new_file)
-            print()
-
-        try:
-            # Pass the destination file's path to the user's function
-            # `post_process()` to allow the user to do post-processing on the
-            # file.
-            cfg.post_process(new_file)
-            print(f'post-processing {new_file}')
-        except TypeError:  # no post-processing function assigned
-            pass
+            info.file_name, info.file_ext = os.path.splitext(basename)
+
+            # Call the user's function `skip(info)` to determine if the
+            # current file should be skipped.
+            if skip_fn is not None and skip_fn(info):
+                if verbose:
+                    write(f'{file} is ignored\n')
+                continue  # go to next file
+
+            new_file_name = ""  # the name of the file + its extension
+            if rename_fn is not None:
+                # Call the user's function `rename(info)` to determine the new
+                # name of the currenly processed file. When an empty string is
+                # returned - the original file's name will be used.
+                new_file_name = rename_fn(info)
+
+            if new_file_name == "":
+                # if no name was returned - use the original name
+                new_file_name = info.file_name + info.file_ext
+
+            # prepend the directory's path to the full file name
+            new_file = dst_prefix + new_file_name
+
+            # Names sent earlier in this run are in `existing_names` (or still
+            # being transferred) even if they aren't on the disk yet.
+            name_key = os.path.normcase(new_file_name)
+            file_exists = (name_key in existing_names
+                           or new_file in pending_transfers)
+            if not file_exists and os.sep in name_key:
+                # renamed into a directory under the destination, which
+                # wasn't listed
+                file_exists = os.path.exists(new_file)
+
+            send = not file_exists or overwrite_file
+            if verbose:
+                if not file_exists:
+                    status = ''
+                elif send:
+                    status = ' - already exists, overwritting'
+                else:
+                    status = ' - already exists, skipping'
+                write(f'{op_str_cont} {file} to {new_file}{status}\n')
+
+            if send:
+                existing_names.add(name_key)
+                if transfer is not None:
+                    transfer(file, new_file)
+
+            if post_process_pool is not None:
+                post_processes.append((new_file, post_process_pool.submit(
+                    _post_process_when_done, pending_transfers.get(new_file),
+                    post_process_fn, new_file)))
+                if verbose:
+                    write(f'post-processing {new_file}\n')
+            elif post_process_fn is not None and transfer_pool is not None:
+                deferred_post_process.append(new_file)
+            elif post_process_fn is not None:
+                # Pass the destination file's path to the user's function
+                # `post_process()` to allow the user to do post-processing on
+                # the file.
+                post_process_fn(new_file)
+                if verbose:
+                    write(f'post-processing {new_file}\n')
+
+        # Post-process each file as soon as its transfer is done, while the
+        # files after it are still being transferred. Files that failed to
+        # transfer aren't post-processed.
+        for new_file in deferred_post_process:
+            pending = pending_transfers.get(new_file)
+            if pending is not None and pending.exception() is not None:
+                continue
+            post_process_fn(new_file)
+            if verbose:
+                write(f'post-processing {new_file}\n')
+
+    errors = []
+    for new_file, pending in transfers:
+        if pending.exception() is not None:
+            print(f'Error: {op_str_cont} to {new_file} failed: '
+                  f'{pending.exception()}', file=sys.stderr)
+            errors.append(pending.exception())
+    for new_file, pending in post_processes:
+        if pending.exception() is not None:
+            print(f'Error: post-processing {new_file} failed: '
+                  f'{pending.exception()}', file=sys.stderr)
+            errors.append(pending.exception())
+    if errors:
+        raise errors[0]
 
     print('\nDone! ', end='')
 
-    if cfg.debug:
+    # Keep the console window open to read the messages, unless nobody is
+    # looking at them (e.g. scripted/background runs, pythonw).
+    if (cfg.debug and sys.stdout is not None and sys.stdout.isatty()
+            and not os.environ.get('SEND_TO_NOPAUSE')):
         input("Press \"Enter\" to exit...")
 
 